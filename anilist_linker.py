@@ -2,8 +2,20 @@ from plexapi.server import PlexServer
 import os
 import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import orjson
 import time
+import sys
+import logging
+import logging.handlers
+import bisect
+from array import array
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pickle
+import shelve
 import dotenv
 import argparse # Import argparse for command-line arguments
 
@@ -18,27 +30,64 @@ PLEX_TOKEN = os.getenv('PLEX_TOKEN', 'YOUR_PLEX_TOKEN')
 # --- Script Settings ---
 MAKE_CHANGES = os.getenv('PLEX_MAKE_CHANGES', 'False').lower() == 'true'
 DEBUG = os.getenv('PLEX_DEBUG', 'False').lower() == 'true' # New Debug variable
+# Directory for the log file; leave empty to log to the console only
+LOG_PATH = os.getenv('PLEX_LOG_PATH', './logs')
 
 TARGET_TV_SHOW_LIBRARIES_STR = os.getenv('PLEX_TARGET_TV_SHOW_LIBRARIES', '')
 TARGET_TV_SHOW_LIBRARIES_LIST = [lib.strip() for lib in TARGET_TV_SHOW_LIBRARIES_STR.split(',') if lib.strip()]
+TARGET_TV_SHOW_LIBRARIES_SET = set(TARGET_TV_SHOW_LIBRARIES_LIST) # For O(1) membership checks
 
 TARGET_MOVIE_LIBRARIES_STR = os.getenv('PLEX_TARGET_MOVIE_LIBRARIES', '')
 TARGET_MOVIE_LIBRARIES_LIST = [lib.strip() for lib in TARGET_MOVIE_LIBRARIES_STR.split(',') if lib.strip()]
+TARGET_MOVIE_LIBRARIES_SET = set(TARGET_MOVIE_LIBRARIES_LIST) # For O(1) membership checks
+
+# Number of Plex items resolved concurrently (Plex tolerates parallel reads; Anilist calls stay serialized)
+PLEX_MAX_WORKERS = int(os.getenv('PLEX_MAX_WORKERS', '8'))
+# Number of items fetched per paged Plex library request (plexapi's default is 100)
+PLEX_CONTAINER_SIZE = 500
 
 # URL for the anime_ids.json file
 ANIME_IDS_JSON_URL = os.getenv('ANIME_IDS_JSON_URL', 'https://raw.githubusercontent.com/Kometa-Team/Anime-IDs/refs/heads/master/anime_ids.json')
 
+# --- Cache Settings ---
+# Directory for the on-disk cache of the pre-processed anime_ids.json lookup maps
+CACHE_PATH = os.getenv('ANILIST_CACHE_PATH', os.path.join(os.path.expanduser('~'), '.cache', 'anilist-linker'))
+ANIME_IDS_CACHE_FILE = os.path.join(CACHE_PATH, 'anime_ids.pickle')
+ANIME_IDS_META_FILE = os.path.join(CACHE_PATH, 'anime_ids.meta.json')
+# Format version of the pickled lookup maps; bump whenever processing or the map types change,
+# so caches written by an older build are rebuilt instead of reused on a 304
+ANIME_IDS_CACHE_VERSION = 2
+# Persistent Anilist ID -> siteUrl cache, shared across runs and libraries
+ANILIST_URL_CACHE_FILE = os.path.join(CACHE_PATH, 'anilist_cache.db')
+
 # --- Anilist Settings ---
 ANILIST_API_URL = os.getenv('ANILIST_API_URL', "https://graphql.anilist.co")
 ANILIST_PREFIX_FORMAT = os.getenv('ANILIST_PREFIX_FORMAT', "[Anilist: {anilist_url}]\n")
-# Updated regex: now uses \/? to make the final slash in the URL optional.
-EXISTING_ANILIST_PREFIX_CHECK_PATTERN = os.getenv('ANILIST_PREFIX_CHECK_PATTERN', r"^\[Anilist: https:\/\/anilist\.co\/anime\/\d+\/?\]\s*")
+# Anilist's canonical siteUrl for an anime; used directly unless VERIFY_ANILIST_ID is enabled
+ANILIST_URL_FORMAT = "https://anilist.co/anime/{anilist_id}"
+# Set to 'True' to confirm each Anilist ID exists via the Anilist API before linking it
+VERIFY_ANILIST_ID = os.getenv('VERIFY_ANILIST_ID', 'False').lower() == 'true'
+# Updated regex: now uses /? to make the final slash in the URL optional.
+DEFAULT_ANILIST_PREFIX_CHECK_PATTERN = r"^\[Anilist: https://anilist\.co/anime/\d+/?\]\s*"
+EXISTING_ANILIST_PREFIX_CHECK_PATTERN = os.getenv('ANILIST_PREFIX_CHECK_PATTERN', DEFAULT_ANILIST_PREFIX_CHECK_PATTERN)
+
+# --- Compiled Patterns ---
+# Compiled once at import time since they run for every Plex item / GUID
+EXISTING_ANILIST_PREFIX_RE = re.compile(EXISTING_ANILIST_PREFIX_CHECK_PATTERN)
+# Literal start of the default pattern, checked with str.startswith before running the regex.
+# A custom pattern may match anything, so it gets an empty literal (always falls through to the regex).
+EXISTING_ANILIST_PREFIX_LITERAL = '[Anilist: https://anilist.co/anime/' if EXISTING_ANILIST_PREFIX_CHECK_PATTERN == DEFAULT_ANILIST_PREFIX_CHECK_PATTERN else ''
+# Single pass over a GUID for all three ID types: groups are (type, numeric id) for TMDB/TVDB, or (imdb id)
+EXTERNAL_ID_GUID_RE = re.compile(r'(tmdb|tvdb)://(\d+)|imdb://(tt\d+)')
 
 # --- Rate Limit Settings ---
 MAX_ANILIST_RETRIES = int(os.getenv('ANILIST_MAX_RETRIES', '5'))
 DEFAULT_RETRY_AFTER_SECONDS = int(os.getenv('ANILIST_DEFAULT_RETRY_AFTER', '60'))
-# Set the Anilist API call rate: 1 call every 2 seconds
-ANILIST_MIN_INTERVAL_SECONDS = 2.0 
+# Token bucket size and refill rate for Anilist API calls (Anilist allows 90 requests per minute).
+# Lowered automatically if the x-ratelimit-limit header reports a smaller limit.
+ANILIST_RATE_LIMIT_PER_MINUTE = int(os.getenv('ANILIST_RATE_LIMIT_PER_MINUTE', '85'))
+# Number of Anilist IDs resolved per GraphQL request (Anilist caps perPage at 50)
+ANILIST_BATCH_SIZE = 50
 
 # Global variable for anime_ids data
 # Now stores pre-processed lookup maps
@@ -47,25 +96,173 @@ ANIME_IDS_DATA = {
     'tvdb_to_anilist': {},
     'imdb_to_anilist': {}
 }
+# (id_type, lookup_map) pairs in matching priority order (TMDB > TVDB > IMDb),
+# bound once by set_anime_ids_data() for direct access in the per-item loop
+ANILIST_LOOKUP_PRIORITY = (
+    ('tmdb', ANIME_IDS_DATA['tmdb_to_anilist']),
+    ('tvdb', ANIME_IDS_DATA['tvdb_to_anilist']),
+    ('imdb', ANIME_IDS_DATA['imdb_to_anilist'])
+)
 # Global list to store titles that could not be matched
 unmatched_items = []
+# Guards unmatched_items, which is appended to from the Plex worker threads
+unmatched_items_lock = threading.Lock()
+# Opened lazily by get_anilist_url_cache()
+anilist_url_cache = None
 
-def print_debug(message):
-    """Prints a debug message only if DEBUG is True."""
-    if DEBUG:
-        print(f"    [DEBUG] {message}")
+class SortedIntMap:
+    """
+    Compact read-only int -> int map for the TMDB/TVDB lookups.
+    Stores keys and values in two parallel sorted arrays (8 + 4 bytes per entry instead of
+    a dict slot plus two int objects) and looks keys up by binary search.
+    Supports the dict methods the script uses: get() and len().
+    """
+    def __init__(self, mapping):
+        sorted_keys = sorted(mapping)
+        self.keys = array('q', sorted_keys)
+        self.values = array('i', [mapping[key] for key in sorted_keys])
+
+    def get(self, key, default=None):
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return self.values[index]
+        return default
+
+    def __len__(self):
+        return len(self.keys)
+
+# Script logger; configured by setup_logging() when run as a script
+log = logging.getLogger('anilist_linker')
+
+class ItemLogBuffer(logging.Filter):
+    """
+    Logger filter that holds back the records a Plex worker thread logs while it resolves an item,
+    so resolve_plex_items can write each item's messages together and in library order.
+    Records from threads that are not buffering pass straight through.
+    """
+    def __init__(self):
+        super().__init__()
+        self.local = threading.local()
+
+    def filter(self, record):
+        records = getattr(self.local, 'records', None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+item_log_buffer = ItemLogBuffer()
+log.addFilter(item_log_buffer)
+
+def setup_logging():
+    """
+    Sends log output to stdout and, if PLEX_LOG_PATH is set, to anilist_linker.log in that directory.
+    The log file is rotated at 5 MB, keeping 3 old files, so scheduled runs don't grow it forever.
+    The level is DEBUG when PLEX_DEBUG is enabled, so disabled debug messages are never formatted.
+    """
+    log.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+    log.propagate = False
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter('%(message)s'))
+    log.addHandler(console_handler)
+    if LOG_PATH:
+        try:
+            os.makedirs(LOG_PATH, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(os.path.join(LOG_PATH, 'anilist_linker.log'),
+                                                                maxBytes=5 * 1024 * 1024, backupCount=3, encoding='utf-8')
+            file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            log.addHandler(file_handler)
+        except OSError as e:
+            log.warning("    [WARNING] Could not open log file in '%s': %s. Logging to the console only.", LOG_PATH, e)
+
+def create_http_session():
+    """
+    Creates the shared requests.Session used for anime_ids.json and Anilist API calls.
+    Keeps connections alive between requests (no new TLS handshake per call) and retries
+    transient 5xx errors with backoff. 429s are handled by query_anilist_batch itself, so
+    Retry-After is not honoured here (urllib3 would otherwise retry 429s inside the adapter).
+    """
+    session = requests.Session()
+    retries = Retry(total=5, backoff_factor=1, status_forcelist=[502, 503, 504],
+                    allowed_methods=['GET', 'POST'], raise_on_status=False,
+                    respect_retry_after_header=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retries)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Accept-Encoding': 'gzip'})
+    return session
+
+# Shared HTTP session (connection pooling / keep-alive)
+http_session = create_http_session()
+
+def load_anime_ids_cache(url):
+    """
+    Loads the cached lookup maps and their HTTP validators (ETag/Last-Modified).
+    Returns (meta, maps), or ({}, None) if there is no usable cache for this URL.
+    """
+    try:
+        with open(ANIME_IDS_META_FILE, 'r') as f:
+            meta = json.load(f)
+        if meta.get('version') != ANIME_IDS_CACHE_VERSION:
+            log.debug("    [DEBUG] Anime IDs cache has format version %s, expected %s. Ignoring cache.", meta.get('version'), ANIME_IDS_CACHE_VERSION)
+            return {}, None
+        if meta.get('url') != url:
+            log.debug("    [DEBUG] Cached anime IDs were downloaded from '%s', not '%s'. Ignoring cache.", meta.get('url'), url)
+            return {}, None
+        with open(ANIME_IDS_CACHE_FILE, 'rb') as f:
+            maps = pickle.load(f)
+        return meta, maps
+    except FileNotFoundError:
+        log.debug("    [DEBUG] No anime IDs cache found in '%s'.", CACHE_PATH)
+    except Exception as e:
+        log.warning("    [WARNING] Could not read anime IDs cache from '%s': %s", CACHE_PATH, e)
+    return {}, None
+
+def save_anime_ids_cache(url, response, maps):
+    """
+    Stores the pre-processed lookup maps plus the response's ETag/Last-Modified headers,
+    so the next run can send a conditional request and skip re-processing on a 304.
+    """
+    meta = {
+        'version': ANIME_IDS_CACHE_VERSION,
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified')
+    }
+    try:
+        os.makedirs(CACHE_PATH, exist_ok=True)
+        with open(ANIME_IDS_CACHE_FILE, 'wb') as f:
+            pickle.dump(maps, f, protocol=5)
+        with open(ANIME_IDS_META_FILE, 'w') as f:
+            json.dump(meta, f)
+        log.debug("    [DEBUG] Saved anime IDs cache to '%s' (ETag: %s, Last-Modified: %s).", CACHE_PATH, meta['etag'], meta['last_modified'])
+    except Exception as e:
+        log.warning("    [WARNING] Could not write anime IDs cache to '%s': %s", CACHE_PATH, e)
 
 def fetch_and_process_anime_ids_json(url):
     """
     Fetches the anime_ids.json file from a URL and pre-processes its content
     into optimized lookup dictionaries (TMDB, TVDB, IMDb to Anilist).
+    Uses a conditional request against the on-disk cache, so an unchanged file
+    is neither downloaded nor re-processed.
     """
     try:
-        print(f"Attempting to download anime IDs from: {url}")
-        response = requests.get(url)
+        cache_meta, cached_maps = load_anime_ids_cache(url)
+        headers = {}
+        if cached_maps is not None:
+            if cache_meta.get('etag'):
+                headers['If-None-Match'] = cache_meta['etag']
+            if cache_meta.get('last_modified'):
+                headers['If-Modified-Since'] = cache_meta['last_modified']
+
+        log.info("Attempting to download anime IDs from: %s", url)
+        response = http_session.get(url, headers=headers)
+        if response.status_code == 304 and cached_maps is not None:
+            log.info("✅ anime_ids.json unchanged since last run. Using cached lookup maps from '%s'.", CACHE_PATH)
+            return cached_maps
         response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
-        raw_json_data = response.json()
-        print("✅ Successfully downloaded anime_ids.json. Pre-processing for faster lookups...")
+        raw_json_data = orjson.loads(response.content) # orjson parses the large file much faster than the stdlib json module
+        log.info("✅ Successfully downloaded anime_ids.json. Pre-processing for faster lookups...")
 
         tmdb_map = {}
         tvdb_map = {}
@@ -95,24 +292,66 @@ def fetch_and_process_anime_ids_json(url):
             imdb_id = mappings.get('imdb_id')
             if imdb_id is not None and isinstance(imdb_id, str):
                 imdb_map[imdb_id] = anilist_id
+        del raw_json_data # Release the full JSON tree now that the maps are built
         
-        print(f"✅ Pre-processing complete. Loaded {len(tmdb_map)} TMDB, {len(tvdb_map)} TVDB, {len(imdb_map)} IMDb mappings.")
-        return {
-            'tmdb_to_anilist': tmdb_map,
-            'tvdb_to_anilist': tvdb_map,
+        log.info("✅ Pre-processing complete. Loaded %s TMDB, %s TVDB, %s IMDb mappings.", len(tmdb_map), len(tvdb_map), len(imdb_map))
+        # TMDB/TVDB IDs are ints and are packed into compact sorted arrays; IMDb IDs stay in a dict
+        processed_maps = {
+            'tmdb_to_anilist': SortedIntMap(tmdb_map),
+            'tvdb_to_anilist': SortedIntMap(tvdb_map),
             'imdb_to_anilist': imdb_map
         }
+        save_anime_ids_cache(url, response, processed_maps)
+        return processed_maps
 
     except requests.exceptions.RequestException as e:
-        print(f"❌ Error downloading {url}: {e}")
+        log.error("❌ Error downloading %s: %s", url, e)
         return None
     except json.JSONDecodeError:
-        print(f"❌ Error: Could not decode JSON from {url}. Ensure it's valid JSON.")
+        log.error("❌ Error: Could not decode JSON from %s. Ensure it's valid JSON.", url)
         return None
     except Exception as e:
-        print(f"❌ An unexpected error occurred while fetching/processing {url}: {e}")
+        log.error("❌ An unexpected error occurred while fetching/processing %s: %s", url, e)
         return None
 
+def add_unmatched_item(item_info):
+    """Records an item for the end-of-run unmatched report. Safe to call from worker threads."""
+    with unmatched_items_lock:
+        unmatched_items.append(item_info)
+
+def get_anilist_url_cache():
+    """
+    Returns the persistent Anilist ID -> siteUrl cache, opening it on first use.
+    Returns None if the cache cannot be opened; lookups then always hit the API.
+    """
+    global anilist_url_cache
+    if anilist_url_cache is None:
+        try:
+            os.makedirs(CACHE_PATH, exist_ok=True)
+            anilist_url_cache = shelve.open(ANILIST_URL_CACHE_FILE, writeback=False)
+            log.debug("    [DEBUG] Opened Anilist URL cache '%s' (%s entries).", ANILIST_URL_CACHE_FILE, len(anilist_url_cache))
+        except Exception as e:
+            log.warning("    [WARNING] Could not open Anilist URL cache '%s': %s", ANILIST_URL_CACHE_FILE, e)
+            anilist_url_cache = {} # In-memory fallback for this run only
+    return anilist_url_cache
+
+def close_anilist_url_cache():
+    """Flushes and closes the persistent Anilist URL cache if it was opened."""
+    global anilist_url_cache
+    if isinstance(anilist_url_cache, shelve.Shelf):
+        anilist_url_cache.close()
+    anilist_url_cache = None
+
+def set_anime_ids_data(processed_data):
+    """Installs the pre-processed lookup maps as ANIME_IDS_DATA and rebuilds ANILIST_LOOKUP_PRIORITY."""
+    global ANIME_IDS_DATA, ANILIST_LOOKUP_PRIORITY
+    ANIME_IDS_DATA = processed_data
+    ANILIST_LOOKUP_PRIORITY = (
+        ('tmdb', processed_data['tmdb_to_anilist']),
+        ('tvdb', processed_data['tvdb_to_anilist']),
+        ('imdb', processed_data['imdb_to_anilist'])
+    )
+
 def extract_all_external_ids_from_guids(item, item_title=""):
     """
     Extracts all available external IDs (TMDB, TVDB, IMDb) from Plex item's GUIDs list.
@@ -121,11 +360,12 @@ def extract_all_external_ids_from_guids(item, item_title=""):
     guids_to_check = item.guids if hasattr(item, 'guids') and item.guids else [getattr(item, 'guid', None)]
 
     if not guids_to_check or guids_to_check == [None]:
-        print_debug(f"No GUIDs found for item '{item_title}'.")
+        log.debug("    [DEBUG] No GUIDs found for item '%s'.", item_title)
         return {}
 
     found_ids = {}
-    print_debug(f"Examining GUIDs for '{item_title}': {[g.id if hasattr(g, 'id') else g for g in guids_to_check]}")
+    if DEBUG:
+        log.debug("    [DEBUG] Examining GUIDs for '%s': %s", item_title, [g.id if hasattr(g, 'id') else g for g in guids_to_check])
 
     for guid_obj in guids_to_check:
         guid_id = guid_obj.id if hasattr(guid_obj, 'id') else str(guid_obj)
@@ -133,246 +373,396 @@ def extract_all_external_ids_from_guids(item, item_title=""):
         if guid_id.startswith('plex://'):
             continue
 
-        match_tmdb = re.search(r'tmdb:\/\/(\d+)', guid_id)
-        if match_tmdb:
-            tmdb_id = int(match_tmdb.group(1))
-            found_ids['tmdb'] = tmdb_id
-            print_debug(f"Found TMDB ID '{tmdb_id}' in GUID '{guid_id}'.")
-
-        match_tvdb = re.search(r'tvdb:\/\/(\d+)', guid_id)
-        if match_tvdb:
-            tvdb_id = int(match_tvdb.group(1))
-            found_ids['tvdb'] = tvdb_id
-            print_debug(f"Found TVDB ID '{tvdb_id}' in GUID '{guid_id}'.")
-
-        match_imdb = re.search(r'imdb:\/\/(tt\d+)', guid_id)
-        if match_imdb:
-            imdb_id = match_imdb.group(1)
-            found_ids['imdb'] = imdb_id
-            print_debug(f"Found IMDb ID '{imdb_id}' in GUID '{guid_id}'.")
+        for match in EXTERNAL_ID_GUID_RE.finditer(guid_id):
+            id_type, numeric_id, imdb_id = match.groups()
+            if imdb_id:
+                id_type, id_value = 'imdb', imdb_id
+            else:
+                id_value = int(numeric_id)
+            if id_type not in found_ids: # Keep the first ID found for each type
+                found_ids[id_type] = id_value
+                log.debug("    [DEBUG] Found %s ID '%s' in GUID '%s'.", id_type.upper(), id_value, guid_id)
+
+        if len(found_ids) == 3: # TMDB, TVDB and IMDb all found; no need to scan the remaining GUIDs
+            break
     
     if not found_ids:
-        print(f"    [INFO] No recognizable TMDB, TVDB, or IMDb ID formats found in GUIDs for '{item_title}'.")
+        log.info("    [INFO] No recognizable TMDB, TVDB, or IMDb ID formats found in GUIDs for '%s'.", item_title)
     else:
-        print(f"    [INFO] Found external IDs for '{item_title}': {found_ids}")
+        log.info("    [INFO] Found external IDs for '%s': %s", item_title, found_ids)
     return found_ids
 
 
-def find_anilist_id_from_json(external_id_type, external_id_value):
+class TokenBucket:
     """
-    Searches the pre-processed ANIME_IDS_DATA for an Anilist ID using the provided external ID.
-    Performs a direct dictionary lookup on the appropriate map.
+    Thread-safe token bucket rate limiter for the Anilist API.
+    Holds up to `capacity` tokens, refilled continuously at `refill_rate` tokens per second,
+    so unused capacity after a quiet period can be spent in a burst.
     """
-    if not ANIME_IDS_DATA or not ANIME_IDS_DATA.get(f'{external_id_type}_to_anilist'):
-        print(f"    [WARNING] Anime ID data for '{external_id_type}' not properly loaded. Cannot find Anilist ID.")
-        return None
-    
-    print_debug(f"Performing direct lookup in pre-processed maps for {external_id_type.upper()} ID '{external_id_value}' (type: {type(external_id_value)})...")
-
-    # Select the correct lookup map based on external_id_type
-    lookup_map = ANIME_IDS_DATA.get(f'{external_id_type}_to_anilist')
-    
-    if lookup_map:
-        anilist_found_id = lookup_map.get(external_id_value)
-        if anilist_found_id:
-            print_debug(f"Direct match found for {external_id_type.upper()} ID '{external_id_value}'! Anilist ID: {anilist_found_id}")
-        else:
-            print_debug(f"No direct match found in {external_id_type.upper()} map for ID '{external_id_value}'.")
-        return anilist_found_id
-    else:
-        print(f"    [INFO] No lookup map available for {external_id_type.upper()}.")
-        return None
-
-
-def search_anilist_by_id(anilist_id, title_for_logging, attempt=1):
+    def __init__(self, capacity, refill_rate):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+
+    def consume(self, tokens=1):
+        """Takes `tokens` from the bucket, sleeping only if not enough are available."""
+        with self.lock:
+            self._refill()
+            if self.tokens < tokens:
+                wait_time = (tokens - self.tokens) / self.refill_rate
+                log.debug("    [DEBUG] Anilist rate limiter out of tokens. Waiting %.2f seconds.", wait_time)
+                time.sleep(wait_time)
+                self._refill()
+            self.tokens -= tokens
+
+    def sync(self, limit, remaining):
+        """Adjusts the bucket to the server's view of the rate limit (x-ratelimit-* headers)."""
+        with self.lock:
+            self._refill()
+            if limit < self.capacity:
+                self.capacity = limit
+                self.refill_rate = limit / 60.0
+            self.tokens = min(self.tokens, float(remaining))
+
+    def drain(self):
+        """Empties the bucket, e.g. after the server answered 429."""
+        with self.lock:
+            self.tokens = 0.0
+            self.last_refill = time.monotonic()
+
+# Shared by every Anilist API request
+anilist_rate_limiter = TokenBucket(ANILIST_RATE_LIMIT_PER_MINUTE, ANILIST_RATE_LIMIT_PER_MINUTE / 60.0)
+
+def query_anilist_batch(anilist_ids):
     """
-    Searches Anilist for an anime by its Anilist ID and returns its siteUrl if found.
-    Handles rate limiting with retries and proactive pausing.
+    Queries Anilist for up to ANILIST_BATCH_SIZE anime in a single request using
+    Page(media: id_in) and returns a dict of {anilist_id: siteUrl} for the IDs found.
+    Handles rate limiting with the shared token bucket, retries and proactive pausing.
     """
-    if attempt > MAX_ANILIST_RETRIES:
-        print(f"    [ERROR] Max retries ({MAX_ANILIST_RETRIES}) exceeded for Anilist ID '{anilist_id}' (Plex title: '{title_for_logging}'). Giving up.")
-        return None
-
     query = """
-    query ($id: Int) {
-      Media (id: $id, type: ANIME) {
-        title {
-          romaji
-          english
-          native
+    query ($ids: [Int], $perPage: Int) {
+      Page (perPage: $perPage) {
+        media (id_in: $ids, type: ANIME) {
+          id
+          title {
+            romaji
+            english
+            native
+          }
+          siteUrl
         }
-        siteUrl
       }
     }
     """
     variables = {
-        'id': anilist_id
+        'ids': anilist_ids,
+        'perPage': ANILIST_BATCH_SIZE
     }
-    
-    try:
-        response = requests.post(ANILIST_API_URL, json={'query': query, 'variables': variables})
-        response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
-        data = response.json()
-
-        # --- Always print Rate Limit Info ---
-        x_ratelimit_limit = response.headers.get('x-ratelimit-limit')
-        x_ratelimit_remaining = response.headers.get('x-ratelimit-remaining')
 
-        if x_ratelimit_limit and x_ratelimit_remaining:
-            try:
-                remaining_requests = int(x_ratelimit_remaining)
-                limit_requests = int(x_ratelimit_limit)
-                print(f"    [ANILIST API] Rate Limit - Limit: {limit_requests}, Remaining: {remaining_requests} for ID '{anilist_id}'.")
+    attempt = 1
+    while attempt <= MAX_ANILIST_RETRIES:
+        anilist_rate_limiter.consume()
+        try:
+            response = http_session.post(ANILIST_API_URL, json={'query': query, 'variables': variables})
+            response.raise_for_status() # Raise an exception for HTTP errors (4xx or 5xx)
+            data = response.json()
 
-                if remaining_requests <= 5: # Proactively pause when remaining requests are low
-                    print(f"    [PROACTIVE RATE LIMIT] Anilist remaining requests ({remaining_requests}) low. Pausing for {DEFAULT_RETRY_AFTER_SECONDS} seconds to reset rate limit.")
-                    time.sleep(DEFAULT_RETRY_AFTER_SECONDS)
+            # --- Always print Rate Limit Info ---
+            x_ratelimit_limit = response.headers.get('x-ratelimit-limit')
+            x_ratelimit_remaining = response.headers.get('x-ratelimit-remaining')
 
-            except ValueError:
-                print(f"    [WARNING] Could not parse Anilist rate limit headers (Limit: '{x_ratelimit_limit}', Remaining: '{x_ratelimit_remaining}').")
-        else:
-            print("    [WARNING] Anilist rate limit headers (x-ratelimit-limit, x-ratelimit-remaining) not found in response.")
-        # --- End Proactive Rate Limit Check ---
+            if x_ratelimit_limit and x_ratelimit_remaining:
+                try:
+                    remaining_requests = int(x_ratelimit_remaining)
+                    limit_requests = int(x_ratelimit_limit)
+                    log.info("    [ANILIST API] Rate Limit - Limit: %s, Remaining: %s for batch of %s IDs.", limit_requests, remaining_requests, len(anilist_ids))
+                    anilist_rate_limiter.sync(limit_requests, remaining_requests)
 
-        # --- Enforce 1 request per 2.0 seconds limit ---
-        time.sleep(ANILIST_MIN_INTERVAL_SECONDS)
+                    if remaining_requests <= 5: # Proactively pause when remaining requests are low
+                        log.info("    [PROACTIVE RATE LIMIT] Anilist remaining requests (%s) low. Pausing for %s seconds to reset rate limit.", remaining_requests, DEFAULT_RETRY_AFTER_SECONDS)
+                        time.sleep(DEFAULT_RETRY_AFTER_SECONDS)
 
+                except ValueError:
+                    log.warning("    [WARNING] Could not parse Anilist rate limit headers (Limit: '%s', Remaining: '%s').", x_ratelimit_limit, x_ratelimit_remaining)
+            else:
+                log.warning("    [WARNING] Anilist rate limit headers (x-ratelimit-limit, x-ratelimit-remaining) not found in response.")
+            # --- End Proactive Rate Limit Check ---
 
-        if data and data.get('data') and data['data'].get('Media') and data['data']['Media'].get('siteUrl'):
-            media = data['data']['Media']
-            
-            # Simple check to ensure we got a valid media object back
-            if not media.get('title'):
-                print(f"    [INFO] Anilist result for ID '{anilist_id}' missing 'title' key or it is None. Skipping.")
-                return None
+            found_urls = {}
+            page = ((data or {}).get('data') or {}).get('Page') or {}
+            for media in page.get('media') or []:
+                if not media or not media.get('id') or not media.get('siteUrl'):
+                    continue
+                # Simple check to ensure we got a valid media object back
+                if not media.get('title'):
+                    log.info("    [INFO] Anilist result for ID '%s' missing 'title' key or it is None. Skipping.", media['id'])
+                    continue
+                found_urls[media['id']] = media['siteUrl']
+
+            missing_ids = [anilist_id for anilist_id in anilist_ids if anilist_id not in found_urls]
+            if missing_ids:
+                log.info("    [INFO] No Anilist data or siteUrl found for IDs %s.", missing_ids)
+            return found_urls
+
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code == 429:
+                retry_after = e.response.headers.get('Retry-After')
+                wait_time = DEFAULT_RETRY_AFTER_SECONDS # Initialize with our fallback default
+
+                log.info("    [RATE LIMIT] 429 Too Many Requests for batch of %s IDs.", len(anilist_ids))
+                if retry_after:
+                    try:
+                        parsed_retry_after = int(retry_after)
+                        wait_time = parsed_retry_after # Use Anilist's explicit instruction
+                        log.info("    [RATE LIMIT] Found 'Retry-After' header: '%s'. Using this value.", retry_after)
+                    except ValueError:
+                        log.warning("    [WARNING] Could not parse 'Retry-After' header '%s'. Using configured default wait time (%ss).", retry_after, DEFAULT_RETRY_AFTER_SECONDS)
+                else:
+                    log.warning("    [WARNING] 'Retry-After' header not found. Using configured default wait time (%ss).", DEFAULT_RETRY_AFTER_SECONDS)
 
-            return media['siteUrl']
+                log.info("    [RATE LIMIT] Waiting for %s seconds before retrying batch (Attempt %s/%s)...", wait_time, attempt, MAX_ANILIST_RETRIES)
+                time.sleep(wait_time)
+                anilist_rate_limiter.drain()
+                attempt += 1
+                continue # Retry the request
+            else:
+                log.error("    [ERROR] HTTP Error %s for Anilist IDs %s: %s", e.response.status_code, anilist_ids, e)
+                return {}
+        except requests.exceptions.RequestException as e:
+            log.error("    [ERROR] Anilist API request failed for Anilist IDs %s: %s", anilist_ids, e)
+            return {}
+        except json.JSONDecodeError:
+            log.error("    [ERROR] Could not decode JSON response from Anilist for IDs %s.", anilist_ids)
+            return {}
+        except Exception as e:
+            log.error("    [ERROR] An unexpected error occurred during Anilist search for IDs %s: %s", anilist_ids, e)
+            return {}
+
+    log.error("    [ERROR] Max retries (%s) exceeded for Anilist IDs %s. Giving up.", MAX_ANILIST_RETRIES, anilist_ids)
+    return {}
+
+def search_anilist_by_ids(anilist_ids):
+    """
+    Looks up the siteUrl for every given Anilist ID and returns a dict of {anilist_id: siteUrl}.
+    IDs are served from the persistent URL cache where possible; the rest are fetched
+    from the Anilist API in batches of ANILIST_BATCH_SIZE IDs per request.
+    """
+    url_cache = get_anilist_url_cache()
+    found_urls = {}
+    ids_to_fetch = []
+
+    for anilist_id in sorted(set(anilist_ids)):
+        cached_url = url_cache.get(str(anilist_id))
+        if cached_url:
+            log.debug("    [DEBUG] Using cached Anilist URL for ID '%s': %s", anilist_id, cached_url)
+            found_urls[anilist_id] = cached_url
         else:
-            print(f"    [INFO] No Anilist data or siteUrl found for ID '{anilist_id}'.")
-            return None
+            ids_to_fetch.append(anilist_id)
 
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 429:
-            retry_after = e.response.headers.get('Retry-After')
-            wait_time = DEFAULT_RETRY_AFTER_SECONDS # Initialize with our fallback default
+    log.info("    [CACHE] %s Anilist URLs found in cache, %s to query from the Anilist API.", len(found_urls), len(ids_to_fetch))
 
-            print(f"    [RATE LIMIT] 429 Too Many Requests for ID '{anilist_id}'.")
-            if retry_after:
-                try:
-                    parsed_retry_after = int(retry_after)
-                    wait_time = parsed_retry_after # Use Anilist's explicit instruction
-                    print(f"    [RATE LIMIT] Found 'Retry-After' header: '{retry_after}'. Using this value.")
-                except ValueError:
-                    print(f"    [WARNING] Could not parse 'Retry-After' header '{retry_after}'. Using configured default wait time ({DEFAULT_RETRY_AFTER_SECONDS}s).")
-            else:
-                print(f"    [WARNING] 'Retry-After' header not found. Using configured default wait time ({DEFAULT_RETRY_AFTER_SECONDS}s).")
+    for batch_start in range(0, len(ids_to_fetch), ANILIST_BATCH_SIZE):
+        batch_ids = ids_to_fetch[batch_start:batch_start + ANILIST_BATCH_SIZE]
+        log.info("    [Anilist] Querying Anilist API for %s IDs (%s/%s)...", len(batch_ids), batch_start + len(batch_ids), len(ids_to_fetch))
+        batch_urls = query_anilist_batch(batch_ids)
+        for anilist_id, anilist_url in batch_urls.items():
+            url_cache[str(anilist_id)] = anilist_url
+        found_urls.update(batch_urls)
 
-            print(f"    [RATE LIMIT] Waiting for {wait_time} seconds before retrying ID '{anilist_id}' (Attempt {attempt}/{MAX_ANILIST_RETRIES})...")
-            time.sleep(wait_time)
-            return search_anilist_by_id(anilist_id, title_for_logging, attempt + 1) # Retry the request
-        else:
-            print(f"    [ERROR] HTTP Error {e.response.status_code} for ID '{anilist_id}': {e}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"    [ERROR] Anilist API request failed for ID '{anilist_id}': {e}")
-        return None
-    except json.JSONDecodeError:
-        print(f"    [ERROR] Could not decode JSON response from Anilist for ID '{anilist_id}'.")
-        return None
-    except Exception as e:
-        print(f"    [ERROR] An unexpected error occurred during Anilist search for ID '{anilist_id}': {e}")
-        return None
+    return found_urls
 
-def process_plex_item(item, item_type="Item"):
+def find_anilist_id(all_external_ids):
     """
-    Processes a single Plex item (TV Show or Movie) to add Anilist link to its summary.
-    This now involves getting all available external IDs, trying them in order (TMDB > TVDB > IMDb),
-    looking up Anilist ID, then querying Anilist API.
+    Looks up the Anilist ID for a set of external IDs, trying them in order (TMDB > TVDB > IMDb)
+    against the pre-processed anime_ids.json maps.
+    Returns (anilist_id, id_type, id_value); anilist_id is None if nothing matched.
+    """
+    # Try TMDB first, then TVDB, then IMDb, with direct lookups in the pre-processed maps
+    for id_type, lookup_map in ANILIST_LOOKUP_PRIORITY:
+        id_value = all_external_ids.get(id_type)
+        if id_value is None:
+            continue
+        anilist_id = lookup_map.get(id_value)
+        if anilist_id:
+            return anilist_id, id_type, id_value
+        log.debug("    [DEBUG] No direct match found in %s map for ID '%s'.", id_type.upper(), id_value)
+    return None, None, None
+
+def resolve_plex_item(item, item_type="Item"):
+    """
+    First pass for a single Plex item (TV Show or Movie): finds its Anilist ID.
+    This involves getting all available external IDs and trying them in order (TMDB > TVDB > IMDb)
+    against the pre-processed anime_ids.json maps.
+    Returns (current_summary, anilist_id), or None if the item is skipped or unmatched.
     """
     try:
-        print(f"Processing {item_type}: '{item.title}'")
+        log.info("Processing %s: '%s'", item_type, item.title)
         current_summary = item.summary if item.summary else ""
         
         # Check if Anilist link is already present at the beginning of the summary
-        if re.match(EXISTING_ANILIST_PREFIX_CHECK_PATTERN, current_summary):
-            print(f"[*] {item_type} '{item.title}': Summary already has an Anilist prefix. Skipping.")
-            return
+        if current_summary.startswith(EXISTING_ANILIST_PREFIX_LITERAL) and EXISTING_ANILIST_PREFIX_RE.match(current_summary):
+            log.info("[*] %s '%s': Summary already has an Anilist prefix. Skipping.", item_type, item.title)
+            return None
 
         # 1. Get all available external IDs from Plex item
         all_external_ids = extract_all_external_ids_from_guids(item, item.title)
         
         if not all_external_ids:
-            print(f"    [INFO] No external IDs found in Plex GUIDs for '{item.title}'. Skipping.")
-            unmatched_items.append(f"{item_type}: {item.title} (No external ID found in Plex GUIDs)")
-            return
+            log.info("    [INFO] No external IDs found in Plex GUIDs for '%s'. Skipping.", item.title)
+            add_unmatched_item(f"{item_type}: {item.title} (No external ID found in Plex GUIDs)")
+            return None
 
-        anilist_id = None
-        used_id_type = None
-        used_id_value = None
-
-        # Try TMDB first
-        if 'tmdb' in all_external_ids:
-            tmdb_id = all_external_ids['tmdb']
-            print(f"    [LOOKUP] Attempting Anilist lookup using TMDB ID: {tmdb_id} for '{item.title}'.")
-            anilist_id = find_anilist_id_from_json('tmdb', tmdb_id)
-            if anilist_id:
-                used_id_type = 'tmdb'
-                used_id_value = tmdb_id
-
-        # If TMDB failed, try TVDB
-        if not anilist_id and 'tvdb' in all_external_ids:
-            tvdb_id = all_external_ids['tvdb']
-            print(f"    [LOOKUP] TMDB lookup failed or not available. Attempting Anilist lookup using TVDB ID: {tvdb_id} for '{item.title}'.")
-            anilist_id = find_anilist_id_from_json('tvdb', tvdb_id)
-            if anilist_id:
-                used_id_type = 'tvdb'
-                used_id_value = tvdb_id
-
-        # If TVDB failed, try IMDb
-        if not anilist_id and 'imdb' in all_external_ids:
-            imdb_id = all_external_ids['imdb']
-            print(f"    [LOOKUP] TVDB lookup failed or not available. Attempting Anilist lookup using IMDb ID: {imdb_id} for '{item.title}'.")
-            anilist_id = find_anilist_id_from_json('imdb', imdb_id)
-            if anilist_id:
-                used_id_type = 'imdb'
-                used_id_value = imdb_id
+        anilist_id, used_id_type, used_id_value = find_anilist_id(all_external_ids)
 
         if not anilist_id:
-            print(f"    [INFO] No Anilist ID found in fetched data for any of the available external IDs ({all_external_ids}) for '{item.title}'. Skipping.")
-            unmatched_items.append(f"{item_type}: {item.title} (No Anilist ID found in JSON for any external ID: {all_external_ids})")
-            return
+            log.info("    [INFO] No Anilist ID found in fetched data for any of the available external IDs (%s) for '%s'. Skipping.", all_external_ids, item.title)
+            add_unmatched_item(f"{item_type}: {item.title} (No Anilist ID found in JSON for any external ID: {all_external_ids})")
+            return None
 
-        print(f"    [Anilist ID] Found Anilist ID: {anilist_id} using {used_id_type.upper()} ID: {used_id_value} for '{item.title}'.")
+        log.info("    [Anilist ID] Found Anilist ID: %s using %s ID: %s for '%s'.", anilist_id, used_id_type.upper(), used_id_value, item.title)
+        return current_summary, anilist_id
 
-        # 3. Search Anilist API using Anilist ID to get the URL
-        print(f"    [Anilist] Querying Anilist API for ID '{anilist_id}'...")
-        anilist_url = search_anilist_by_id(anilist_id, item.title)
+    except Exception as e:
+        log.error("[ERROR] %s '%s': Could not process item. Error: %s", item_type, item.title, e)
+        return None
 
-        if anilist_url:
-            prefix_to_add = ANILIST_PREFIX_FORMAT.format(anilist_url=anilist_url)
-            new_summary = prefix_to_add + current_summary
-            
-            # Ensure no extra leading newlines are introduced by prefixing an empty summary
-            new_summary = new_summary.lstrip('\n') 
-
-            if MAKE_CHANGES:
-                print(f"[MODIFIED] {item_type} '{item.title}': Prepending Anilist link: {anilist_url}")
-                item.editSummary(new_summary)
-                item.reload() # Reload to confirm change if needed
-                print(f"    New Summary (Plex will show first 100 chars): {item.summary[:100]}...")
-            else:
-                print(f"[DRY RUN] {item_type} '{item.title}': Would prepend Anilist link: {anilist_url}")
-                if not current_summary:
-                    print(f"    Original Summary was EMPTY.")
-                else:
-                    print(f"    Original Summary: '{current_summary}'")
-                print(f"    Proposed Full Summary: '{new_summary}'") # Show the full proposed new summary explicitly
+def resolve_plex_item_buffered(item, item_type="Item"):
+    """Runs resolve_plex_item on a worker thread, returning (result, log records) instead of logging directly."""
+    item_log_buffer.local.records = records = []
+    try:
+        return resolve_plex_item(item, item_type), records
+    finally:
+        item_log_buffer.local.records = None
+
+def write_item_log(records):
+    """Writes one item's buffered log records as a single block, without other threads' output in between."""
+    handlers = log.handlers
+    for handler in handlers:
+        handler.acquire()
+    try:
+        for record in records:
+            log.handle(record)
+    finally:
+        for handler in handlers:
+            handler.release()
+
+def resolve_plex_items(executor, items, item_type="Item"):
+    """
+    Runs the first pass for a list of Plex items concurrently on the given executor.
+    Yields the matched items as (item, item_type, current_summary, anilist_id) tuples in library order,
+    as soon as each one is resolved. Each item's log messages are written together, also in library order.
+    """
+    resolved_items = executor.map(lambda item: resolve_plex_item_buffered(item, item_type), items)
+    for item, (resolved, records) in zip(items, resolved_items):
+        write_item_log(records)
+        if resolved:
+            yield (item, item_type) + resolved
+
+def apply_anilist_link(item, item_type, current_summary, anilist_url):
+    """
+    Second pass for a single Plex item: prepends the Anilist link to its summary
+    (or reports what would change in a dry run).
+    """
+    try:
+        prefix_to_add = ANILIST_PREFIX_FORMAT.format(anilist_url=anilist_url)
+        new_summary = prefix_to_add + current_summary
+        
+        # Ensure no extra leading newlines are introduced by prefixing an empty summary
+        new_summary = new_summary.lstrip('\n') 
+
+        if MAKE_CHANGES:
+            log.info("[MODIFIED] %s '%s': Prepending Anilist link: %s", item_type, item.title, anilist_url)
+            item.editSummary(new_summary)
+            if DEBUG:
+                item.reload() # Reload to confirm the change as stored by Plex (extra request, debug only)
+                log.debug("    [DEBUG] New Summary (Plex will show first 100 chars): %s...", item.summary[:100])
         else:
-            print(f"    [INFO] No Anilist URL found via API for ID '{anilist_id}' for '{item.title}' ({item_type}).")
-            unmatched_items.append(f"{item_type}: {item.title} (No Anilist URL found via API for ID {anilist_id})")
+            log.info("[DRY RUN] %s '%s': Would prepend Anilist link: %s", item_type, item.title, anilist_url)
+            if not current_summary:
+                log.info("    Original Summary was EMPTY.")
+            else:
+                log.info("    Original Summary: '%s'", current_summary)
+            log.info("    Proposed Full Summary: '%s'", new_summary) # Show the full proposed new summary explicitly
 
     except Exception as e:
-        print(f"[ERROR] {item_type} '{item.title}': Could not process item. Error: {e}")
+        log.error("[ERROR] %s '%s': Could not process item. Error: %s", item_type, item.title, e)
+
+class AnilistLookupQueue:
+    """
+    Hands matched Anilist IDs to the background Anilist executor (VERIFY_ANILIST_ID) while Plex items
+    are still being resolved: every ANILIST_BATCH_SIZE new IDs are submitted as one lookup, so the
+    rate-limited API requests overlap with the rest of the Plex scan, even within a single library.
+    The executor has a single worker, keeping Anilist calls serialized behind the rate limiter.
+    IDs already queued this run (e.g. shows present in several libraries) are not looked up again.
+    """
+    def __init__(self, executor):
+        self.executor = executor
+        self.queued_ids = set()
+        self.pending_ids = []
+        self.lookups = []
+
+    def add(self, anilist_id):
+        """Queues one Anilist ID, submitting a lookup once a full batch of new IDs has been collected."""
+        if anilist_id in self.queued_ids:
+            return
+        self.queued_ids.add(anilist_id)
+        self.pending_ids.append(anilist_id)
+        if len(self.pending_ids) >= ANILIST_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Submits the IDs collected since the last lookup, if any."""
+        if self.pending_ids:
+            log.info("    [Anilist] Queued Anilist API lookup for %s new Anilist IDs in the background.", len(self.pending_ids))
+            self.lookups.append(self.executor.submit(search_anilist_by_ids, self.pending_ids))
+            self.pending_ids = []
+
+    def cancel(self):
+        """Cancels the lookups that have not started yet."""
+        for lookup in self.lookups:
+            lookup.cancel()
+
+def link_pending_items(pending_sections, anilist_lookups=()):
+    """
+    Resolves the Anilist URLs for all items collected in the first pass, then applies the summary edits
+    one library at a time.
+    URLs are built from the Anilist ID directly; with VERIFY_ANILIST_ID they are instead
+    collected from the background Anilist API lookups (see AnilistLookupQueue),
+    which also confirms the IDs exist.
+    pending_sections is a list of (section, section_items) pairs, where section_items holds
+    (item, item_type, current_summary, anilist_id) tuples.
+    """
+    pending_items = [pending_item for _, section_items in pending_sections for pending_item in section_items]
+    if VERIFY_ANILIST_ID:
+        log.info("\n--- Waiting for Anilist API results for %s matched items ---", len(pending_items))
+        anilist_urls = {}
+        for lookup in anilist_lookups:
+            try:
+                anilist_urls.update(lookup.result())
+            except Exception as e:
+                log.error("    [ERROR] Anilist API lookup failed: %s", e)
+    else:
+        anilist_urls = {anilist_id: ANILIST_URL_FORMAT.format(anilist_id=anilist_id) for _, _, _, anilist_id in pending_items}
+
+    log.info("\n--- Updating Plex Summaries ---")
+    # Each summary is different, so Plex needs one edit request per item (plexapi's batchMultiEdits
+    # only applies the same values to every item); the item is not reloaded afterwards outside debug mode.
+    for section, section_items in pending_sections:
+        log.info("\nUpdating %s items in library: %s", len(section_items), section.title)
+        for item, item_type, current_summary, anilist_id in section_items:
+            anilist_url = anilist_urls.get(anilist_id)
+            if anilist_url:
+                apply_anilist_link(item, item_type, current_summary, anilist_url)
+            else:
+                log.info("    [INFO] No Anilist URL found via API for ID '%s' for '%s' (%s).", anilist_id, item.title, item_type)
+                add_unmatched_item(f"{item_type}: {item.title} (No Anilist URL found via API for ID {anilist_id})")
 
 
 if __name__ == "__main__":
@@ -382,145 +772,192 @@ if __name__ == "__main__":
                         help="Bypass the confirmation prompt for live runs (MAKE_CHANGES=True).")
     args = parser.parse_args()
 
+    setup_logging()
+
     # Check if Plex URL/Token are still placeholders
     if PLEX_URL == 'YOUR_PLEX_URL' or PLEX_TOKEN == 'YOUR_PLEX_TOKEN':
-        print("⚠️  Please configure your PLEX_URL and PLEX_TOKEN.")
-        print("   Set them in a .env file (e.g., PLEX_URL='http://localhost:32400')")
-        print("   or as system environment variables.")
+        log.warning("⚠️  Please configure your PLEX_URL and PLEX_TOKEN.")
+        log.info("   Set them in a .env file (e.g., PLEX_URL='http://localhost:32400')")
+        log.info("   or as system environment variables.")
         exit() # Exit if essential config is missing
 
     # --- Print Current Configuration ---
-    print("\n--- Current Script Configuration ---")
-    print(f"  Plex URL: {PLEX_URL}")
-    print(f"  Make Changes (Dry Run): {MAKE_CHANGES}")
-    print(f"  Debug Mode: {DEBUG}") # Display Debug status
+    log.info("\n--- Current Script Configuration ---")
+    log.info("  Plex URL: %s", PLEX_URL)
+    log.info("  Make Changes (Dry Run): %s", MAKE_CHANGES)
+    log.info("  Debug Mode: %s", DEBUG) # Display Debug status
+    log.info("  Log Path: %s", LOG_PATH if LOG_PATH else 'DISABLED (console only)')
+    log.info("  Plex Worker Threads: %s", PLEX_MAX_WORKERS)
     # Updated text to reflect new behavior
-    print(f"  Target TV Show Libraries: {TARGET_TV_SHOW_LIBRARIES_LIST if TARGET_TV_SHOW_LIBRARIES_LIST else 'SKIPPED (empty)'}")
-    print(f"  Target Movie Libraries: {TARGET_MOVIE_LIBRARIES_LIST if TARGET_MOVIE_LIBRARIES_LIST else 'SKIPPED (empty)'}")
-    print(f"  Anilist IDs JSON URL: {ANIME_IDS_JSON_URL}")
-    print(f"  Anilist API URL: {ANILIST_API_URL}")
-    print(f"  Anilist Prefix Format: '{ANILIST_PREFIX_FORMAT.replace('{anilist_url}', 'https://anilist.co/anime/XXXX/')}'")
-    print(f"  Anilist Prefix Check Pattern: '{EXISTING_ANILIST_PREFIX_CHECK_PATTERN}'")
-    print(f"  Max Anilist Retries: {MAX_ANILIST_RETRIES}")
-    print(f"  Default Retry After (seconds): {DEFAULT_RETRY_AFTER_SECONDS}")
-    print(f"  Anilist Minimum Interval (seconds): {ANILIST_MIN_INTERVAL_SECONDS}")
-    print("------------------------------------\n")
+    log.info("  Target TV Show Libraries: %s", TARGET_TV_SHOW_LIBRARIES_LIST if TARGET_TV_SHOW_LIBRARIES_LIST else 'SKIPPED (empty)')
+    log.info("  Target Movie Libraries: %s", TARGET_MOVIE_LIBRARIES_LIST if TARGET_MOVIE_LIBRARIES_LIST else 'SKIPPED (empty)')
+    log.info("  Anilist IDs JSON URL: %s", ANIME_IDS_JSON_URL)
+    log.info("  Cache Path: %s", CACHE_PATH)
+    log.info("  Anilist API URL: %s", ANILIST_API_URL)
+    log.info("  Anilist Prefix Format: '%s'", ANILIST_PREFIX_FORMAT.replace('{anilist_url}', 'https://anilist.co/anime/XXXX/'))
+    log.info("  Anilist Prefix Check Pattern: '%s'", EXISTING_ANILIST_PREFIX_CHECK_PATTERN)
+    log.info("  Max Anilist Retries: %s", MAX_ANILIST_RETRIES)
+    log.info("  Default Retry After (seconds): %s", DEFAULT_RETRY_AFTER_SECONDS)
+    log.info("  Anilist Rate Limit (requests/minute): %s", ANILIST_RATE_LIMIT_PER_MINUTE)
+    log.info("  Anilist Batch Size: %s", ANILIST_BATCH_SIZE)
+    log.info("  Verify Anilist IDs via API: %s", VERIFY_ANILIST_ID)
+    log.info("------------------------------------\n")
 
     # Load the anime_ids.json data once at the start from the URL
-    print(f"Loading anime IDs from {ANIME_IDS_JSON_URL}...")
+    log.info("Loading anime IDs from %s...", ANIME_IDS_JSON_URL)
     # Call the new fetch_and_process function
     processed_data = fetch_and_process_anime_ids_json(ANIME_IDS_JSON_URL)
     if processed_data is None:
-        print("Exiting due to error loading or processing anime_ids.json from URL.")
+        log.error("Exiting due to error loading or processing anime_ids.json from URL.")
         exit()
-    # Assign the processed data to the global variable
-    ANIME_IDS_DATA = processed_data
-    print(f"✅ Successfully loaded {len(ANIME_IDS_DATA['tmdb_to_anilist'])} TMDB, {len(ANIME_IDS_DATA['tvdb_to_anilist'])} TVDB, {len(ANIME_IDS_DATA['imdb_to_anilist'])} IMDb mappings.")
+    # Assign the processed data to the global variables
+    set_anime_ids_data(processed_data)
+    log.info("✅ Successfully loaded %s TMDB, %s TVDB, %s IMDb mappings.", len(ANIME_IDS_DATA['tmdb_to_anilist']), len(ANIME_IDS_DATA['tvdb_to_anilist']), len(ANIME_IDS_DATA['imdb_to_anilist']))
 
 
     if not MAKE_CHANGES:
-        print("🚀 --- Starting DRY RUN (no changes will be made to Plex) --- 🚀")
-        print("     Set PLEX_MAKE_CHANGES=True in your .env file or environment to apply changes.")
+        log.info("🚀 --- Starting DRY RUN (no changes will be made to Plex) --- 🚀")
+        log.info("     Set PLEX_MAKE_CHANGES=True in your .env file or environment to apply changes.")
     else:
-        print("🔥 --- Starting REAL RUN (changes WILL be made to Plex) --- 🔥")
+        log.info("🔥 --- Starting REAL RUN (changes WILL be made to Plex) --- 🔥")
         # Bypass prompt if -y or --yes argument is provided
         if args.yes:
-            print("     Bypassing confirmation prompt due to -y/--yes flag.")
+            log.info("     Bypassing confirmation prompt due to -y/--yes flag.")
         else:
             proceed = input("     Are you ABSOLUTELY SURE you want to proceed? (yes/no): ")
             if proceed.lower() != 'yes':
-                print("Aborted by user.")
+                log.info("Aborted by user.")
                 exit()
 
+    executor = None
+    anilist_executor = None
+    anilist_lookup_queue = None
     try:
-        print(f"\nAttempting to connect to Plex server at {PLEX_URL}...")
+        log.info("\nAttempting to connect to Plex server at %s...", PLEX_URL)
         plex = PlexServer(PLEX_URL, PLEX_TOKEN)
-        print("✅ Successfully connected to Plex!\n")
+        log.info("✅ Successfully connected to Plex!\n")
+
+        # Items matched to an Anilist ID in the first pass, per library:
+        # (section, [(item, item_type, current_summary, anilist_id), ...])
+        pending_sections = []
+        # Worker pool for the first pass (GUID fetch + JSON lookup per item)
+        executor = ThreadPoolExecutor(max_workers=PLEX_MAX_WORKERS)
+        # Single background worker for Anilist API lookups (VERIFY_ANILIST_ID), overlapping them with Plex reads
+        anilist_executor = ThreadPoolExecutor(max_workers=1)
+        anilist_lookup_queue = AnilistLookupQueue(anilist_executor)
 
         # --- Process TV Show Libraries ---
-        print("\n--- Processing TV Show Libraries ---")
+        log.info("\n--- Processing TV Show Libraries ---")
         all_tv_show_sections = [s for s in plex.library.sections() if s.type == 'show']
         
         if TARGET_TV_SHOW_LIBRARIES_LIST:
-            tv_show_sections_to_scan = [s for s in all_tv_show_sections if s.title in TARGET_TV_SHOW_LIBRARIES_LIST]
+            tv_show_sections_to_scan = [s for s in all_tv_show_sections if s.title in TARGET_TV_SHOW_LIBRARIES_SET]
             if not tv_show_sections_to_scan:
-                print(f"No TV show libraries found matching your PLEX_TARGET_TV_SHOW_LIBRARIES: {TARGET_TV_SHOW_LIBRARIES_LIST}.")
-                print("Please ensure the library names are exact (case-sensitive) as listed in Plex.")
-                print("\n--- Detected TV Show Libraries in Plex (Copy Exact Names) ---")
+                log.info("No TV show libraries found matching your PLEX_TARGET_TV_SHOW_LIBRARIES: %s.", TARGET_TV_SHOW_LIBRARIES_LIST)
+                log.info("Please ensure the library names are exact (case-sensitive) as listed in Plex.")
+                log.info("\n--- Detected TV Show Libraries in Plex (Copy Exact Names) ---")
                 if all_tv_show_sections:
                     for section in all_tv_show_sections:
-                        print(f"- '{section.title}'")
+                        log.info("- '%s'", section.title)
                 else:
-                    print("No TV show libraries of type 'show' found in your Plex server.")
-                print("----------------------------------------------------------\n")
+                    log.info("No TV show libraries of type 'show' found in your Plex server.")
+                log.info("----------------------------------------------------------\n")
         else:
             tv_show_sections_to_scan = [] # Changed: If no targets, process none
-            print("PLEX_TARGET_TV_SHOW_LIBRARIES is empty. Skipping ALL TV Show libraries.")
+            log.info("PLEX_TARGET_TV_SHOW_LIBRARIES is empty. Skipping ALL TV Show libraries.")
 
 
         if not tv_show_sections_to_scan:
-            print("No TV show libraries to process. Skipping TV Show scan.")
+            log.info("No TV show libraries to process. Skipping TV Show scan.")
         else:
             for section in tv_show_sections_to_scan:
-                print(f"\nScanning TV Show Library: {section.title}")
-                shows = section.all()
+                log.info("\nScanning TV Show Library: %s", section.title)
+                shows = section.all(container_size=PLEX_CONTAINER_SIZE)
                 if not shows:
-                    print(f"No TV shows found in '{section.title}'.")
+                    log.info("No TV shows found in '%s'.", section.title)
                     continue
-                for i, show in enumerate(shows):
-                    process_plex_item(show, item_type="TV Show")
+                section_items = []
+                for pending_item in resolve_plex_items(executor, shows, item_type="TV Show"):
+                    section_items.append(pending_item)
+                    if VERIFY_ANILIST_ID:
+                        anilist_lookup_queue.add(pending_item[-1]) # Look up while the rest is still resolving
+                if section_items:
+                    pending_sections.append((section, section_items))
 
 
         # --- Process Movie Libraries ---
-        print("\n--- Processing Movie Libraries ---")
+        log.info("\n--- Processing Movie Libraries ---")
         all_movie_sections = [s for s in plex.library.sections() if s.type == 'movie']
         
         if TARGET_MOVIE_LIBRARIES_LIST:
-            movie_sections_to_scan = [s for s in all_movie_sections if s.title in TARGET_MOVIE_LIBRARIES_LIST]
+            movie_sections_to_scan = [s for s in all_movie_sections if s.title in TARGET_MOVIE_LIBRARIES_SET]
             if not movie_sections_to_scan:
-                print(f"No Movie libraries found matching your PLEX_TARGET_MOVIE_LIBRARIES: {TARGET_MOVIE_LIBRARIES_LIST}.")
-                print("Please ensure the library names are exact (case-sensitive) as listed in Plex.")
-                print("\n--- Detected Movie Libraries in Plex (Copy Exact Names) ---")
+                log.info("No Movie libraries found matching your PLEX_TARGET_MOVIE_LIBRARIES: %s.", TARGET_MOVIE_LIBRARIES_LIST)
+                log.info("Please ensure the library names are exact (case-sensitive) as listed in Plex.")
+                log.info("\n--- Detected Movie Libraries in Plex (Copy Exact Names) ---")
                 if all_movie_sections:
                     for section in all_movie_sections:
-                        print(f"- '{section.title}'")
+                        log.info("- '%s'", section.title)
                 else:
-                    print("No Movie libraries of type 'movie' found in your Plex server.")
-                print("----------------------------------------------------------\n")
+                    log.info("No Movie libraries of type 'movie' found in your Plex server.")
+                log.info("----------------------------------------------------------\n")
         else:
             movie_sections_to_scan = [] # Changed: If no targets, process none
-            print("PLEX_TARGET_MOVIE_LIBRARIES is empty. Skipping ALL Movie libraries.")
+            log.info("PLEX_TARGET_MOVIE_LIBRARIES is empty. Skipping ALL Movie libraries.")
 
 
         if not movie_sections_to_scan:
-            print("No movie libraries to process. Skipping Movie scan.")
+            log.info("No movie libraries to process. Skipping Movie scan.")
         else:
             for section in movie_sections_to_scan:
-                print(f"\nScanning Movie Library: {section.title}")
-                movies = section.all()
+                log.info("\nScanning Movie Library: %s", section.title)
+                movies = section.all(container_size=PLEX_CONTAINER_SIZE)
                 if not movies:
-                    print(f"No movies found in '{section.title}'.")
+                    log.info("No movies found in '%s'.", section.title)
                     continue
-                for i, movie in enumerate(movies):
-                    process_plex_item(movie, item_type="Movie")
+                section_items = []
+                for pending_item in resolve_plex_items(executor, movies, item_type="Movie"):
+                    section_items.append(pending_item)
+                    if VERIFY_ANILIST_ID:
+                        anilist_lookup_queue.add(pending_item[-1]) # Look up while the rest is still resolving
+                if section_items:
+                    pending_sections.append((section, section_items))
+
+        # --- Resolve Anilist URLs in batches and update summaries ---
+        if pending_sections:
+            anilist_lookup_queue.flush()
+            link_pending_items(pending_sections, anilist_lookup_queue.lookups)
+        else:
+            log.info("\nNo items matched an Anilist ID. Skipping Anilist API queries.")
 
 
-        print("\n--- Script Finished ---")
+        log.info("\n--- Script Finished ---")
         if not MAKE_CHANGES:
-            print("Remember, this was a DRY RUN. No changes were saved to Plex.")
+            log.info("Remember, this was a DRY RUN. No changes were saved to Plex.")
         else:
-            print("Changes have been applied to Plex (if any items met the criteria).\n")
-            print("Note: If you ran a dry run previously, some items might have been skipped if their summaries already matched the proposed changes.")
+            log.info("Changes have been applied to Plex (if any items met the criteria).\n")
+            log.info("Note: If you ran a dry run previously, some items might have been skipped if their summaries already matched the proposed changes.")
 
         # --- START OF UNMATCHED ITEMS OUTPUT ---
         if unmatched_items:
-            print("\n--- Items for which Anilist link could not be determined ---")
+            log.info("\n--- Items for which Anilist link could not be determined ---")
             for item_info in unmatched_items:
-                print(f"- {item_info}")
-            print("--------------------------------------------------\n")
+                log.info("- %s", item_info)
+            log.info("--------------------------------------------------\n")
         else:
-            print("\n🎉 All processed Plex items found a matching Anilist link (or were skipped as already linked).")
+            log.info("\n🎉 All processed Plex items found a matching Anilist link (or were skipped as already linked).")
         # --- END OF UNMATCHED ITEMS OUTPUT ---
 
     except Exception as e:
-        print(f"❌ An error occurred during the script execution: {e}")
+        log.error("❌ An error occurred during the script execution: %s", e)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if anilist_executor is not None:
+            anilist_lookup_queue.cancel() # Skip lookups that have not started yet
+            # The URL cache was opened on the Anilist worker thread; shelve's dbm.sqlite3 backend
+            # (Python 3.13+) only allows it to be closed from that same thread
+            anilist_executor.submit(close_anilist_url_cache).result()
+            anilist_executor.shutdown()
+        else:
+            close_anilist_url_cache()